@@ -1,12 +1,14 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import copy
 import datetime
 import os
 import sys
 import time
 import pymysql
 import re
+from concurrent.futures import ProcessPoolExecutor
 from utils.binlogfile2sql_util import command_line_args, BinLogFileReader
 from utils.binlog2sql_util import concat_sql_from_binlog_event, is_dml_event, event_type, logger, set_log_format, \
     get_gtid_set, is_want_gtid, save_result_sql, dt_now, handle_rollback_sql, \
@@ -309,6 +311,28 @@ class BinlogFile2sql(object):
         pass
 
 
+def parse_binlog_file(binlog_file, file_index, connection_settings, args):
+    """parse one binlog file, module level so that --parallel workers can run it"""
+    logger.info('parsing binlog file: %s [%s]' %
+                (binlog_file, timestamp_to_datetime(os.stat(binlog_file).st_mtime)))
+    bin2sql = BinlogFile2sql(
+        file_path=binlog_file, connection_settings=connection_settings, start_pos=args.start_pos,
+        end_pos=args.end_pos, start_time=args.start_time, stop_time=args.stop_time,
+        only_schemas=args.databases, result_dir=args.result_dir, only_tables=args.tables, no_pk=args.no_pk,
+        flashback=args.flashback, only_dml=args.only_dml, sql_type=args.sql_type, file_index=file_index,
+        stop_never=args.stop_never, need_comment=args.need_comment, rename_db=args.rename_db,
+        only_pk=args.only_pk, result_file=args.result_file, table_per_file=args.table_per_file,
+        ignore_databases=args.ignore_databases, ignore_tables=args.ignore_tables, rename_tb=args.rename_tb,
+        ignore_columns=args.ignore_columns, replace=args.replace, insert_ignore=args.insert_ignore,
+        ignore_virtual_columns=args.ignore_virtual_columns, date_prefix=args.date_prefix,
+        remove_not_update_col=args.remove_not_update_col, no_date=args.no_date,
+        include_gtids=args.include_gtids, exclude_gtids=args.exclude_gtids, tmp_dir=args.tmp_dir,
+        update_to_replace=args.update_to_replace, keep_not_update_col=args.keep_not_update_col,
+        where=args.where, args=args,
+    )
+    return bin2sql.process_binlog()
+
+
 def main(args):
     connection_settings = {'host': args.host, 'port': args.port, 'user': args.user, 'passwd': args.password}
     binlog_file_list, executed_file_list = get_binlog_file_list(args)
@@ -333,34 +357,56 @@ def main(args):
             args.only_dml = True
 
     while True:
-        for i, binlog_file in enumerate(binlog_file_list):
-            if not (i == 0 and binlog_file == args.start_file):
-                args.start_pos = None
-                args.end_pos = None
-            logger.info('parsing binlog file: %s [%s]' %
-                        (binlog_file, timestamp_to_datetime(os.stat(binlog_file).st_mtime)))
-            bin2sql = BinlogFile2sql(
-                file_path=binlog_file, connection_settings=connection_settings, start_pos=args.start_pos,
-                end_pos=args.end_pos, start_time=args.start_time, stop_time=args.stop_time,
-                only_schemas=args.databases, result_dir=args.result_dir, only_tables=args.tables, no_pk=args.no_pk,
-                flashback=args.flashback, only_dml=args.only_dml, sql_type=args.sql_type, file_index=i,
-                stop_never=args.stop_never, need_comment=args.need_comment, rename_db=args.rename_db,
-                only_pk=args.only_pk, result_file=args.result_file, table_per_file=args.table_per_file,
-                ignore_databases=args.ignore_databases, ignore_tables=args.ignore_tables, rename_tb=args.rename_tb,
-                ignore_columns=args.ignore_columns, replace=args.replace, insert_ignore=args.insert_ignore,
-                ignore_virtual_columns=args.ignore_virtual_columns, date_prefix=args.date_prefix,
-                remove_not_update_col=args.remove_not_update_col, no_date=args.no_date,
-                include_gtids=args.include_gtids, exclude_gtids=args.exclude_gtids, tmp_dir=args.tmp_dir,
-                update_to_replace=args.update_to_replace, keep_not_update_col=args.keep_not_update_col,
-                where=args.where, args=args,
-            )
-            r = bin2sql.process_binlog()
-            if not args.stop_never:
-                continue
-
-            if r is True:
-                executed_file_list.append(binlog_file)
-                save_executed_result(args.record_file, executed_file_list)
+        if args.parallel > 1 and len(binlog_file_list) > 1:
+            # --parallel is only allowed with --stop-never, where every binlog file has its own result file
+            file_args_list = []
+            for i, binlog_file in enumerate(binlog_file_list):
+                if not (i == 0 and binlog_file == args.start_file):
+                    args.start_pos = None
+                    args.end_pos = None
+                file_args_list.append(copy.copy(args))
+
+            # submit the biggest files first so a big file picked up last doesn't keep the pool waiting,
+            # futures are kept by file index to record executed files in file name order
+            submit_order = sorted(range(len(binlog_file_list)),
+                                  key=lambda idx: os.stat(binlog_file_list[idx]).st_size, reverse=True)
+            futures = [None] * len(binlog_file_list)
+            parse_error = None
+            with ProcessPoolExecutor(max_workers=min(args.parallel, len(binlog_file_list))) as executor:
+                for i in submit_order:
+                    futures[i] = executor.submit(parse_binlog_file, binlog_file_list[i], i, connection_settings,
+                                                 file_args_list[i])
+                # record every file that finished, even after another one failed, or the next run would
+                # append its result again
+                for binlog_file, future in zip(binlog_file_list, futures):
+                    if future.cancelled():
+                        continue
+                    try:
+                        r = future.result()
+                    except Exception as e:
+                        if parse_error is None:
+                            parse_error = e
+                            # files not started yet are left for the next run
+                            for pending in futures:
+                                pending.cancel()
+                        continue
+                    if r is True:
+                        executed_file_list.append(binlog_file)
+                        save_executed_result(args.record_file, executed_file_list)
+            if parse_error is not None:
+                raise parse_error
+        else:
+            for i, binlog_file in enumerate(binlog_file_list):
+                if not (i == 0 and binlog_file == args.start_file):
+                    args.start_pos = None
+                    args.end_pos = None
+                r = parse_binlog_file(binlog_file, i, connection_settings, args)
+                if not args.stop_never:
+                    continue
+
+                if r is True:
+                    executed_file_list.append(binlog_file)
+                    save_executed_result(args.record_file, executed_file_list)
 
         if not args.stop_never:
             break
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 import os
+import mmap
+import functools
+import queue
 import pymysql
 import struct
 import argparse
@@ -25,18 +28,141 @@ except ImportError:
     COM_BINLOG_DUMP_GTID = 0x1e
 
 from io import BytesIO
-from pymysql.util import byte2int
 
 # 2013 Connection Lost
 # 2006 MySQL server has gone away
 MYSQL_EXPECTED_ERROR_CODES = [2013, 2006]
 
+# timestamp, event_type, server_id, event_size, log_pos, flags
+_EVENT_HDR = struct.Struct('<IBIIIH')
+
+# columns of every table in a schema, or of a single table with the table_name filter
+_TABLE_INFORMATION_SQL = """
+    SELECT
+        TABLE_NAME, COLUMN_NAME, COLLATION_NAME, CHARACTER_SET_NAME,
+        COLUMN_COMMENT, COLUMN_TYPE, COLUMN_KEY, ORDINAL_POSITION
+    FROM
+        information_schema.columns
+    WHERE
+        table_schema = %s
+        {virtual_filter}
+        {table_filter}
+    ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+# event type -> event class map BinLogPacketWrapper dispatches on, unknown types become NotImplementedEvent.
+# Read from the wrapper itself so the event type bitmask can never disagree with it
+_EVENT_CLASS_MAP = BinLogPacketWrapper._BinLogPacketWrapper__event_map
+
 
 class StringIOAdvance(BytesIO):
     def advance(self, length):
         self.seek(self.tell() + length)
 
 
+class CtlConnectionPool(object):
+    """Keep ctl connections open between BinLogFileReader instances, so parsing a directory
+    of binlog files doesn't connect to MySQL once per file
+    """
+
+    def __init__(self, connect, settings, max_cached=4):
+        self._connect = connect
+        self._settings = settings
+        self._idle = queue.LifoQueue(max_cached)
+
+    def connection(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect(**self._settings)
+            try:
+                conn.ping(reconnect=True)
+                return conn
+            except pymysql.Error:
+                self.discard(conn)
+
+    def release(self, conn):
+        # end the transaction the ctl queries opened, pymysql doesn't autocommit by default
+        try:
+            conn.rollback()
+        except pymysql.Error:
+            self.discard(conn)
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self.discard(conn)
+
+    @staticmethod
+    def discard(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# ctl connection pools by connect function and connection settings
+_CTL_POOLS = {}
+
+
+def get_ctl_pool(connect, settings):
+    # keyed by pid too, a forked --parallel worker must not share its parent's sockets
+    key = (os.getpid(), connect, repr(sorted(settings.items())))
+    if key not in _CTL_POOLS:
+        _CTL_POOLS[key] = CtlConnectionPool(connect, dict(settings))
+    return _CTL_POOLS[key]
+
+
+def _event_key(events):
+    return None if events is None else tuple(events)
+
+
+@functools.lru_cache(maxsize=None)
+def _allowed_event_sets(only_events, ignored_events, filter_non_implemented_events):
+    """Return allowed events, events allowed on packet level and the event type bitmask of the latter,
+    cached because every BinLogFileReader of a run asks for the same ones
+    """
+    if only_events is not None:
+        events = set(only_events)
+    else:
+        events = set((
+            QueryEvent,
+            RotateEvent,
+            StopEvent,
+            FormatDescriptionEvent,
+            XidEvent,
+            GtidEvent,
+            BeginLoadQueryEvent,
+            ExecuteLoadQueryEvent,
+            UpdateRowsEvent,
+            WriteRowsEvent,
+            DeleteRowsEvent,
+            TableMapEvent,
+            HeartbeatLogEvent,
+            NotImplementedEvent,
+        ))
+    if ignored_events is not None:
+        for e in ignored_events:
+            events.remove(e)
+    if filter_non_implemented_events:
+        try:
+            events.remove(NotImplementedEvent)
+        except KeyError:
+            pass
+    allowed_events = frozenset(events)
+
+    # We can't filter on packet level TABLE_MAP and rotate event because
+    # we need them for handling other operations
+    allowed_events_in_packet = frozenset([TableMapEvent, RotateEvent]).union(allowed_events)
+
+    # bit n is set if BinLogPacketWrapper would build an event for event type n
+    allowed_type_mask = sum(
+        1 << t for t in range(256)
+        if _EVENT_CLASS_MAP.get(t, NotImplementedEvent) in allowed_events_in_packet)
+    return allowed_events, allowed_events_in_packet, allowed_type_mask
+
+
 class BinLogFileReader(object):
     """Connect to replication stream and read event
     """
@@ -52,6 +178,7 @@ class BinLogFileReader(object):
         # open file
         self._file = None
         self._file_path = file_path
+        self._mm = None
         self._pos = None
 
         self.__connected_stream = False
@@ -59,6 +186,7 @@ class BinLogFileReader(object):
         self.__resume_stream = resume_stream
         self.__blocking = blocking
         self._ctl_connection = None
+        self._ctl_pool = None
         self._ctl_connection_settings = ctl_connection_settings
         if ctl_connection_settings:
             self._ctl_connection_settings.setdefault("charset", "utf8mb4")
@@ -68,14 +196,13 @@ class BinLogFileReader(object):
         self.__only_schemas = only_schemas
         self.__ignored_schemas = ignored_schemas
         self.__freeze_schema = freeze_schema
-        self.__allowed_events = self._allowed_event_list(
-            only_events, ignored_events, filter_non_implemented_events)
+        self.__allowed_events, self.__allowed_events_in_packet, self.__allowed_type_mask = _allowed_event_sets(
+            _event_key(only_events), _event_key(ignored_events), filter_non_implemented_events)
         self.__fail_on_table_metadata_unavailable = fail_on_table_metadata_unavailable
-
-        # We can't filter on packet level TABLE_MAP and rotate event because
-        # we need them for handling other operations
-        self.__allowed_events_in_packet = frozenset(
-            [TableMapEvent, RotateEvent]).union(self.__allowed_events)
+        # information_schema columns by (schema, table), filled a whole schema at a time,
+        # or only the tables of only_tables in it when that is set
+        self.__table_information = {}
+        self.__prefetched_schemas = set()
 
         # Store table meta information
         self.table_map = {}
@@ -90,6 +217,16 @@ class BinLogFileReader(object):
         self.slave_uuid = slave_uuid
         self.slave_heartbeat = slave_heartbeat
         self.ignore_virtual_columns = ignore_virtual_columns
+        # statement texts stay the same for the whole reader, only the bound schema and table change
+        virtual_filter = "AND EXTRA != 'VIRTUAL GENERATED'" if ignore_virtual_columns else ''
+        self.__prefetch_tables = tuple(only_tables) if only_tables else ()
+        prefetch_filter = ''
+        if self.__prefetch_tables:
+            prefetch_filter = 'AND table_name IN ({0})'.format(', '.join(['%s'] * len(self.__prefetch_tables)))
+        self.__schema_columns_sql = _TABLE_INFORMATION_SQL.format(
+            virtual_filter=virtual_filter, table_filter=prefetch_filter)
+        self.__table_columns_sql = _TABLE_INFORMATION_SQL.format(
+            virtual_filter=virtual_filter, table_filter='AND table_name = %s')
 
         if pymysql_wrapper:
             self.pymysql_wrapper = pymysql_wrapper
@@ -98,20 +235,28 @@ class BinLogFileReader(object):
 
         # checksum with database
         self.__use_checksum = self.__checksum_enabled()
+        # filter arguments BinLogPacketWrapper takes for every event, packed once
+        self.__packet_filter_args = (self.__allowed_events_in_packet, only_tables, ignored_tables,
+                                     only_schemas, ignored_schemas, freeze_schema,
+                                     fail_on_table_metadata_unavailable)
 
     def close(self):
+        if self._mm:
+            self._mm.close()
+            self._mm = None
         if self._file:
             self._file.close()
             self._file_path = None
         if self.__connected_ctl:
             self._ctl_connection._get_table_information = None
-            self._ctl_connection.close()
+            self._ctl_pool.release(self._ctl_connection)
             self.__connected_ctl = False
 
     def __connect_to_ctl(self):
         self._ctl_connection_settings["db"] = "information_schema"
         self._ctl_connection_settings["cursorclass"] = DictCursor
-        self._ctl_connection = self.pymysql_wrapper(**self._ctl_connection_settings)
+        self._ctl_pool = get_ctl_pool(self.pymysql_wrapper, self._ctl_connection_settings)
+        self._ctl_connection = self._ctl_pool.connection()
         self._ctl_connection._get_table_information = self.__get_table_information
         self.__connected_ctl = True
 
@@ -136,7 +281,7 @@ class BinLogFileReader(object):
 
     def __connect_to_stream(self):
         if self._file is None:
-            self._file = open(self._file_path, 'rb+')
+            self._file = open(self._file_path, 'rb')
             self._pos = self._file.tell()
             assert self._pos == 0
         # read magic
@@ -148,53 +293,70 @@ class BinLogFileReader(object):
                 messagefmt = 'Magic bytes {0!r} did not match expected {1!r}'
                 message = messagefmt.format(magic, self._expected_magic)
                 raise BadMagicBytesError(message)
+        # binlog is scanned forward only, map it once and slice events out of the mapping
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
 
     def fetchone(self):
+        if not self._file:
+            self.__connect_to_stream()
+
+        # the loop body runs once per event, so look up everything that can't change in it only once
+        mm = self._mm
+        mm_size = len(mm)
+        table_map = self.table_map
+        use_checksum = self.__use_checksum
+        packet_filter_args = self.__packet_filter_args
+        allowed_events = self.__allowed_events
+        allowed_type_mask = self.__allowed_type_mask
+        start_pos = self.start_pos
+        stop_pos = self.stop_pos
+        skip_to_timestamp = self.skip_to_timestamp
         while True:
-            if not self._file:
-                self.__connect_to_stream()
-
             if not self.__connected_ctl and self._ctl_connection_settings:
                 self.__connect_to_ctl()
 
-            # read pkt
-            pkt = StringIOAdvance()
-            # headerlength 19
-            header = self._file.read(19)
-            if not header:
+            # read pkt, headerlength 19
+            pos = self._pos
+            if pos + 19 > mm_size:
+                break
+
+            timestamp, event_type, server_id, event_size, log_pos, flags = _EVENT_HDR.unpack_from(mm, pos)
+            if event_size < 19:
+                messagefmt = 'Event size {0} at position {1} is smaller than the event header'
+                raise EventSizeTooSmallError(messagefmt.format(event_size, pos))
+            # truncated last event, e.g. the binlog is still being written
+            if pos + event_size > mm_size:
                 break
+            self._pos = pos + event_size
 
-            unpacked = struct.unpack('<IcIIIH', header)
-            timestamp = unpacked[0]
-            event_type = byte2int(unpacked[1])
-            server_id = unpacked[2]
-            event_size = unpacked[3]
-            log_pos = unpacked[4]
-            flags = unpacked[5]
-
-            body = self._file.read(event_size - 19)
-            pkt.write(b'0')
-            pkt.write(header)
-            pkt.write(body)
-            pkt.seek(0)
-
-            binlog_event = BinLogPacketWrapper(pkt, self.table_map,
-                                               self._ctl_connection,
-                                               self.__use_checksum,
-                                               self.__allowed_events_in_packet,
-                                               self.__only_tables,
-                                               self.__ignored_tables,
-                                               self.__only_schemas,
-                                               self.__ignored_schemas,
-                                               self.__freeze_schema,
-                                               self.__fail_on_table_metadata_unavailable)
-
-            if not binlog_event.event or binlog_event.log_pos < self.start_pos:
+            # filter on the header first, so events outside the wanted range are never sliced or parsed
+            if log_pos < start_pos:
                 continue
 
-            if self.stop_pos and binlog_event.log_pos >= self.stop_pos:
+            if stop_pos and log_pos >= stop_pos:
                 break
 
+            # BinLogPacketWrapper would leave the event empty anyway
+            if not (allowed_type_mask >> event_type) & 1:
+                continue
+
+            # RotateEvent still has to go through, see the skip_to_timestamp check below
+            if skip_to_timestamp and timestamp < skip_to_timestamp and event_type != ROTATE_EVENT:
+                if log_pos:
+                    self.log_pos = log_pos
+                continue
+
+            # the byte before the header stands in for the OK byte BinLogPacketWrapper skips.
+            # BytesIO shares a bytes object until it is written to, so slicing the mmap is the only copy,
+            # a memoryview slice would be copied by BytesIO instead
+            pkt = StringIOAdvance(mm[pos - 1:pos + event_size])
+
+            binlog_event = BinLogPacketWrapper(pkt, table_map, self._ctl_connection, use_checksum,
+                                               *packet_filter_args)
+
+            if not binlog_event.event:
+                continue
+
             if binlog_event.event_type == ROTATE_EVENT:
                 self.log_pos = binlog_event.event.position
                 self.log_file = binlog_event.event.next_binlog
@@ -207,7 +369,7 @@ class BinLogFileReader(object):
                 # invalidates all our cached table id to schema mappings. This means we have to load them all
                 # again for each logfile which is potentially wasted effort but we can't really do much better
                 # without being broken in restart case
-                self.table_map = {}
+                self.table_map = table_map = {}
             elif binlog_event.log_pos:
                 self.log_pos = binlog_event.log_pos
 
@@ -235,90 +397,57 @@ class BinLogFileReader(object):
             #   There are conditions under which the terminating
             #   log-rotation event does not occur. For example, the server
             #   might crash.
-            if self.skip_to_timestamp and binlog_event.timestamp < self.skip_to_timestamp:
+            if skip_to_timestamp and binlog_event.timestamp < skip_to_timestamp:
                 continue
 
             if binlog_event.event_type == TABLE_MAP_EVENT and \
                     binlog_event.event is not None:
-                self.table_map[binlog_event.event.table_id] = \
+                table_map[binlog_event.event.table_id] = \
                     binlog_event.event.get_table()
 
             # event is none if we have filter it on packet level
             # we filter also not allowed events
-            if binlog_event.event is None or (binlog_event.event.__class__ not in self.__allowed_events):
+            if binlog_event.event is None or (type(binlog_event.event) not in allowed_events):
                 continue
 
             return binlog_event.event
 
-    def _allowed_event_list(self, only_events, ignored_events,
-                            filter_non_implemented_events):
-        if only_events is not None:
-            events = set(only_events)
-        else:
-            events = set((
-                QueryEvent,
-                RotateEvent,
-                StopEvent,
-                FormatDescriptionEvent,
-                XidEvent,
-                GtidEvent,
-                BeginLoadQueryEvent,
-                ExecuteLoadQueryEvent,
-                UpdateRowsEvent,
-                WriteRowsEvent,
-                DeleteRowsEvent,
-                TableMapEvent,
-                HeartbeatLogEvent,
-                NotImplementedEvent,
-            ))
-        if ignored_events is not None:
-            for e in ignored_events:
-                events.remove(e)
-        if filter_non_implemented_events:
-            try:
-                events.remove(NotImplementedEvent)
-            except KeyError:
-                pass
-        return frozenset(events)
-
     def __get_table_information(self, schema, table):
+        # the first lookup in a schema fetches the columns of all its (only_tables) tables in one query
+        if (schema, table) not in self.__table_information and schema not in self.__prefetched_schemas:
+            columns = self.__query_table_information(schema)
+            if columns is not None:
+                self.__prefetched_schemas.add(schema)
+                for column in columns:
+                    self.__table_information.setdefault((schema, column.pop('TABLE_NAME')), []).append(column)
+
+        # not prefetched, e.g. table name differs in case or the table was created after the prefetch
+        if (schema, table) not in self.__table_information:
+            columns = self.__query_table_information(schema, table)
+            if columns is None:
+                return None
+            for column in columns:
+                column.pop('TABLE_NAME')
+            self.__table_information[(schema, table)] = columns
+        return self.__table_information[(schema, table)]
+
+    def __query_table_information(self, schema, table=None):
         for i in range(1, 3):
             try:
                 if not self.__connected_ctl:
                     self.__connect_to_ctl()
 
                 cur = self._ctl_connection.cursor()
-                if self.ignore_virtual_columns:
-                    sql = """
-                        SELECT
-                            COLUMN_NAME, COLLATION_NAME, CHARACTER_SET_NAME,
-                            COLUMN_COMMENT, COLUMN_TYPE, COLUMN_KEY, ORDINAL_POSITION
-                        FROM
-                            information_schema.columns
-                        WHERE
-                            EXTRA != 'VIRTUAL GENERATED'
-                            AND table_schema = '%s' 
-                            AND table_name = '%s'
-                        ORDER BY ORDINAL_POSITION
-                    """ % (schema, table)
+                if table is None:
+                    sql, params = self.__schema_columns_sql, (schema,) + self.__prefetch_tables
                 else:
-                    sql = """
-                        SELECT
-                            COLUMN_NAME, COLLATION_NAME, CHARACTER_SET_NAME,
-                            COLUMN_COMMENT, COLUMN_TYPE, COLUMN_KEY, ORDINAL_POSITION
-                        FROM
-                            information_schema.columns
-                        WHERE
-                            table_schema = '%s' 
-                            AND table_name = '%s'
-                        ORDER BY ORDINAL_POSITION
-                    """ % (schema, table)
-
-                cur.execute(sql)
-                return cur.fetchall()
+                    sql, params = self.__table_columns_sql, (schema, table)
+                cur.execute(sql, params)
+                return list(cur.fetchall())
             except pymysql.OperationalError as error:
                 code, message = error.args
                 if code in MYSQL_EXPECTED_ERROR_CODES:
+                    self._ctl_pool.discard(self._ctl_connection)
                     self.__connected_ctl = False
                     continue
                 else:
@@ -370,6 +499,9 @@ def parse_args():
     binlog_file_filter.add_argument('-ma', '--minutes-ago', dest='minutes_ago', type=int, default=3,
                                     help='When you use --stop-never, we only parse specify minutes ago of '
                                          'modify time of file.')
+    binlog_file_filter.add_argument('--parallel', dest='parallel', type=int, default=1,
+                                    help='When you use --stop-never, parse up to this many binlog files at the same '
+                                         'time in separate processes.')
 
     return parser
 
@@ -414,6 +546,15 @@ def command_line_args(args):
         logger.error('Args --minutes-ago must not lower than 1.')
         sys.exit(1)
 
+    if args.parallel < 1:
+        logger.error('Args --parallel must not lower than 1.')
+        sys.exit(1)
+
+    if args.parallel > 1 and (not args.stop_never or args.table_per_file):
+        logger.error('Args --parallel only work with --stop-never and without --table-per-file, '
+                     'when every binlog file is saved into its own result file.')
+        sys.exit(1)
+
     if (args.result_file or args.stop_never or args.table_per_file) and not os.path.exists(args.result_dir):
         os.makedirs(args.result_dir, exist_ok=True)
     args.result_file = os.path.join(args.result_dir, args.result_file.split(sep)[-1]) \
@@ -10,6 +10,7 @@ import uuid
 from datetime import datetime as dt
 from contextlib import contextmanager
 
+DEFAULT_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
 
 # create a logger
 logger = logging.getLogger('json_utils')
@@ -67,13 +68,13 @@ def read_file(filename):
         return []
 
     with open(filename, 'r', encoding='utf8') as f:
-        return list(map(lambda s: s.strip('\n'), f.readlines()))
+        return [line.rstrip('\n') for line in f]
 
 
 def save_executed_result(result_file, result_list):
-    result_list = list(map(lambda s: s + '\n', result_list))
     with open(result_file, 'w', encoding='utf8') as f:
-        f.writelines(result_list)
+        if result_list:
+            f.write('\n'.join(result_list) + '\n')
     return
 
 
@@ -81,24 +82,25 @@ def get_binlog_file_list(args):
     binlog_file_list = []
     executed_file_list = read_file(args.record_file) if args.stop_never and os.path.exists(args.record_file) else []
     if args.file_dir and not args.file_path:
-        for f in sorted(os.listdir(args.file_dir)):
-            if args.start_file and f < args.start_file:
+        file_regex = re.compile(args.file_regex)
+        executed_file_set = set(executed_file_list)
+        # files modified after this moment may still be written by mysqld
+        mtime_cutoff = time.time() - args.minutes_ago * 60
+        with os.scandir(args.file_dir) as it:
+            entries = sorted((entry for entry in it if file_regex.search(entry.name) is not None),
+                             key=lambda entry: entry.name)
+        for entry in entries:
+            if args.start_file and entry.name < args.start_file:
                 continue
-            if args.stop_file and f > args.stop_file:
+            if args.stop_file and entry.name > args.stop_file:
                 break
-            if re.search(args.file_regex, f) is not None:
-                binlog_file = os.path.join(args.file_dir, f)
-                if args.stop_never and \
-                        (int(time.time() - os.path.getmtime(binlog_file)) < args.minutes_ago * 60 or
-                         binlog_file in executed_file_list):
-                    continue
-                binlog_file_list.append(binlog_file)
+            if args.stop_never and (entry.path in executed_file_set or entry.stat().st_mtime > mtime_cutoff):
+                continue
+            binlog_file_list.append(entry.path)
     else:
         binlog_file_list.extend(args.file_path)
 
-    for f in executed_file_list.copy():
-        if not os.path.exists(f):
-            executed_file_list.remove(f)
+    executed_file_list = [f for f in executed_file_list if os.path.exists(f)]
 
     return binlog_file_list, executed_file_list
 
@@ -118,8 +120,9 @@ def timestamp_to_datetime(ts: int, datetime_format: str = None) -> str:
     :param datetime_format: 传入指定的时间格式
     :return 指定格式的时间字符串
     """
-    if datetime_format is None:
-        datetime_format = '%Y-%m-%d %H:%M:%S'
+    # 默认格式直接用 time.strftime 格式化，不需要创建 datetime 对象
+    if datetime_format is None or datetime_format == DEFAULT_DATETIME_FORMAT:
+        return time.strftime(DEFAULT_DATETIME_FORMAT, time.localtime(ts))
 
     datetime_obj = dt.fromtimestamp(ts)
     datetime_str = datetime_obj.strftime(datetime_format)